@@ -1,44 +1,101 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from datetime import datetime
 from typing import List, Dict
 import httpx
+import os
+from ..limits import rate_limiter, ml_concurrency, response_cache, counters
+from ..tracing import span, propagation_headers
 
 router = APIRouter()
 
 ML_SERVICE_URL = "http://ml_service:8002"  # Wewnętrzny adres w sieci dockerowej
 
+# Maksymalny horyzont prognozy - ta sama zmienna środowiskowa co w serwisie ML
+MAX_FORECAST_DAYS = int(os.getenv("MAX_FORECAST_DAYS", "14"))
+
+def _degrade(response: Response, cache_key: tuple, reason: str, status_code: int) -> Dict:
+    """
+    Zwraca ostatnią zapamiętaną odpowiedź zamiast wywołania serwisu ML,
+    a gdy jej brak - odrzuca żądanie.
+    """
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        counters["rejected"] += 1
+        raise HTTPException(
+            status_code=status_code,
+            detail="Zbyt wiele żądań, spróbuj ponownie później",
+            headers={"Retry-After": "1"}
+        )
+    data, age = cached
+    counters["served_stale"] += 1
+    response.headers["X-Degraded"] = reason
+    response.headers["Age"] = str(int(age))
+    return data
+
+async def _call_ml_service(request: Request, response: Response, path: str, params: Dict) -> Dict:
+    """
+    Wywołuje serwis ML z kontrolą dopuszczenia: limit żądań per klient i trasa
+    oraz limit równoległych wywołań. Po przekroczeniu limitów zwraca
+    ostatnią zapamiętaną odpowiedź zamiast kolejkować żądanie.
+    """
+    cache_key = (path, tuple(sorted(params.items())))
+    client_host = request.client.host if request.client else "unknown"
+    
+    if not rate_limiter.allow((client_host, request.scope["route"].path)):
+        counters["throttled"] += 1
+        return _degrade(response, cache_key, "throttled", 429)
+    
+    with span("queue_wait"):
+        admitted = await ml_concurrency.acquire()
+    if not admitted:
+        counters["shed"] += 1
+        return _degrade(response, cache_key, "shed", 503)
+    
+    try:
+        with span("proxy", path=path):
+            async with httpx.AsyncClient() as client:
+                ml_response = await client.get(
+                    f"{ML_SERVICE_URL}{path}",
+                    params=params,
+                    headers=propagation_headers()
+                )
+                # Błędy żądania (np. 422 dla niedozwolonego horyzontu) przekazujemy klientowi
+                # z oryginalnym kodem zamiast zamieniać je na 500
+                if ml_response.is_client_error:
+                    is_json = ml_response.headers.get("content-type", "").startswith("application/json")
+                    raise HTTPException(
+                        status_code=ml_response.status_code,
+                        detail=ml_response.json().get("detail") if is_json else ml_response.text
+                    )
+                ml_response.raise_for_status()
+                data = ml_response.json()
+    finally:
+        ml_concurrency.release()
+    
+    response_cache.set(cache_key, data)
+    return data
+
 @router.get("/forecast/{city_name}")
-async def get_weather_forecast(city_name: str, date: str) -> Dict:
+async def get_weather_forecast(request: Request,
+                               response: Response,
+                               city_name: str,
+                               days: int = Query(7, ge=1, le=MAX_FORECAST_DAYS),
+                               intervals: bool = False) -> Dict:
     """
-    Get weather data for a specific city and date
+    Pobiera wielodniową prognozę pogody dla danego miasta z serwisu ML.
     """
     try:
-        # Convert date string to datetime
-        forecast_date = datetime.strptime(date, "%Y-%m-%d")
-        
-        # Get city coordinates
-        coordinates = WeatherService.get_city_coordinates(city_name)
-        if not coordinates:
-            raise HTTPException(status_code=404, detail=f"City {city_name} not found")
-        
-        # Get weather data
-        weather_data = WeatherService.get_weather_data(
-            coordinates["latitude"],
-            coordinates["longitude"],
-            forecast_date
+        return await _call_ml_service(
+            request, response,
+            f"/forecast/{city_name}",
+            {"days": days, "intervals": intervals}
         )
-        
-        if not weather_data:
-            raise HTTPException(status_code=404, detail="Weather data not available for this date")
-        
-        return {
-            "city": coordinates["name"],
-            "country": coordinates["country"],
-            "weather": weather_data
-        }
-        
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Błąd podczas komunikacji z serwisem ML: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/historical/{city_name}")
 async def get_historical_weather(
@@ -76,18 +133,19 @@ async def get_historical_weather(
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
 @router.get("/{city}")
-async def get_weather_prediction(city: str, date: str = None) -> Dict:
+async def get_weather_prediction(request: Request,
+                                 response: Response,
+                                 city: str,
+                                 date: str = None,
+                                 intervals: bool = False) -> Dict:
     """
     Pobiera predykcję pogody dla danego miasta z serwisu ML.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{ML_SERVICE_URL}/predict/{city}",
-                params={"date": date} if date else None
-            )
-            response.raise_for_status()
-            return response.json()
+        params = {"date": date, "intervals": intervals} if date else {"intervals": intervals}
+        return await _call_ml_service(request, response, f"/predict/{city}", params)
+    except HTTPException:
+        raise
     except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Błąd podczas komunikacji z serwisem ML: {str(e)}")
     except Exception as e:
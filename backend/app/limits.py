@@ -0,0 +1,139 @@
+"""
+Admission control for calls to the ML service: per-client/per-route token
+buckets, a cap on concurrent upstream calls and a cache of the last good
+responses used to degrade gracefully when limits are hit.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Configurable limits (environment variables)
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "5"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+ML_MAX_CONCURRENCY = int(os.getenv("ML_MAX_CONCURRENCY", "8"))
+ML_ADMISSION_TIMEOUT = float(os.getenv("ML_ADMISSION_TIMEOUT", "0.05"))
+STALE_CACHE_SIZE = int(os.getenv("STALE_CACHE_SIZE", "1024"))
+MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))
+
+# Counters exposed at /limits
+counters = {
+    "throttled": 0,
+    "shed": 0,
+    "served_stale": 0,
+    "rejected": 0
+}
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` tokens per second up to `capacity`.
+    """
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def allow(self, rate: float, capacity: float, now: float) -> bool:
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RateLimiter:
+    """
+    One token bucket per key (client, route). Least recently used buckets are
+    dropped above `max_buckets`, so memory stays bounded under many clients.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: int = RATE_LIMIT_BURST,
+                 max_buckets: int = MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def allow(self, key: Hashable) -> bool:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.allow(self.rate, self.burst, now)
+
+
+class ConcurrencyLimiter:
+    """
+    Caps concurrent upstream calls. Waits at most `timeout` seconds for a free
+    slot instead of queueing without bound.
+    """
+
+    def __init__(self, limit: int = ML_MAX_CONCURRENCY, timeout: float = ML_ADMISSION_TIMEOUT):
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> bool:
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+class ResponseCache:
+    """
+    LRU cache of the last successful response per request, served when the
+    request cannot be admitted.
+    """
+
+    def __init__(self, max_size: int = STALE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """
+        Returns (value, age in seconds) or None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        value, stored_at = entry
+        return value, time.monotonic() - stored_at
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+def get_limits_status() -> Dict:
+    """
+    Current limit configuration and counters.
+    """
+    return {
+        "config": {
+            "rate_limit_per_second": RATE_LIMIT_PER_SECOND,
+            "rate_limit_burst": RATE_LIMIT_BURST,
+            "ml_max_concurrency": ML_MAX_CONCURRENCY,
+            "ml_admission_timeout": ML_ADMISSION_TIMEOUT
+        },
+        "counters": dict(counters)
+    }
+
+
+rate_limiter = RateLimiter()
+ml_concurrency = ConcurrencyLimiter()
+response_cache = ResponseCache()
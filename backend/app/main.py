@@ -1,13 +1,29 @@
-from fastapi import FastAPI
+import os
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from .api import weather
+from .limits import get_limits_status
+from .tracing import start_trace, span, TRACE_HEADER
 
 app = FastAPI(title="VentiGlobe Backend")
 
-# Configure CORS
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Samples requests for tracing and records the root span
+    """
+    trace_id = start_trace()
+    if trace_id is None:
+        return await call_next(request)
+    with span("backend.request", method=request.method, path=request.url.path):
+        response = await call_next(request)
+    response.headers[TRACE_HEADER] = trace_id
+    return response
+
+# Configure CORS (comma-separated origins, "*" by default for local development)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with specific origins
+    allow_origins=os.getenv("CORS_ORIGINS", "*").split(","),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -18,4 +34,11 @@ app.include_router(weather.router, prefix="/api/weather", tags=["weather"])
 
 @app.get("/")
 async def root():
-    return {"message": "VentiGlobe Backend is running"} 
\ No newline at end of file
+    return {"message": "VentiGlobe Backend is running"} 
+
+@app.get("/limits")
+async def limits():
+    """
+    Rate limit / load shedding configuration and counters
+    """
+    return get_limits_status()
@@ -0,0 +1,94 @@
+"""
+Lightweight request tracing. The backend makes the sampling decision and
+always passes it to the ML service in X-Trace-Sampled (with the trace id in
+X-Trace-Id when sampled). Spans are appended as JSON lines to TRACE_FILE
+(a local stand-in for a collector).
+"""
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+SERVICE_NAME = "backend"
+TRACE_HEADER = "X-Trace-Id"
+PARENT_SPAN_HEADER = "X-Parent-Span-Id"
+SAMPLED_HEADER = "X-Trace-Sampled"
+
+# Fraction of requests traced (0 disables tracing)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# (trace_id, current span id) of the request being handled; None when not sampled
+_context: ContextVar[Optional[Tuple[str, Optional[str]]]] = ContextVar("trace_context", default=None)
+_export_lock = threading.Lock()
+
+
+def _export(record: Dict) -> None:
+    line = json.dumps(record)
+    with _export_lock:
+        with open(TRACE_FILE, "a") as f:
+            f.write(line + "\n")
+
+
+def start_trace(trace_id: Optional[str] = None, parent_id: Optional[str] = None) -> Optional[str]:
+    """
+    Starts tracing the current request: continues `trace_id` when given,
+    otherwise samples a new trace. Returns the trace id or None.
+    """
+    if trace_id is None:
+        if TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE:
+            return None
+        trace_id = uuid.uuid4().hex
+    _context.set((trace_id, parent_id))
+    return trace_id
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Records a span around the block. No-op when the request is not sampled.
+    """
+    context = _context.get()
+    if context is None:
+        yield
+        return
+
+    trace_id, parent_id = context
+    span_id = uuid.uuid4().hex[:16]
+    token = _context.set((trace_id, span_id))
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        _context.reset(token)
+        _export({
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "service": SERVICE_NAME,
+            "name": name,
+            "start": start,
+            "duration_ms": round(duration_ms, 3),
+            "attributes": attributes
+        })
+
+
+def propagation_headers() -> Dict[str, str]:
+    """
+    Headers passing the sampling decision and the current trace to a downstream service.
+    """
+    context = _context.get()
+    if context is None:
+        return {SAMPLED_HEADER: "0"}
+    trace_id, span_id = context
+    headers = {SAMPLED_HEADER: "1", TRACE_HEADER: trace_id}
+    if span_id:
+        headers[PARENT_SPAN_HEADER] = span_id
+    return headers
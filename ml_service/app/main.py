@@ -1,15 +1,42 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 from typing import Dict
 import asyncio
 import os
 from app.ml.data_collection.fetch_data import fetch_and_save_historical_data
-from app.ml.models.train_model import train_and_save_model
-from app.ml.models.predict import get_weather_prediction
+from app.ml.models.train_model import train_and_save_model, update_and_save_model, train_and_save_sharded_models
+from app.ml.models.predict import get_weather_prediction, get_weather_forecast, DEFAULT_QUANTILES, MAX_FORECAST_DAYS, ForecastHorizonError, shard_router, SHARDING_ENABLED
+from app.ml.feature_store.feature_store import get_feature_store
+from app.tracing import start_trace, span, TRACE_HEADER, PARENT_SPAN_HEADER, SAMPLED_HEADER
 
 app = FastAPI(title="VentiGlobe ML Service")
 
+# Współrzędne miast
+CITY_COORDS = {
+    "Warsaw": (52.22977, 21.01178),
+    "Krakow": (50.06143, 19.93658),
+    "Gdansk": (54.35227, 18.64912),
+    "Wroclaw": (51.1, 17.03333)
+}
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Kontynuuje ślad z backendu (nagłówki X-Trace-Sampled i X-Trace-Id) i zapisuje span żądania.
+    """
+    trace_id = start_trace(
+        request.headers.get(TRACE_HEADER),
+        request.headers.get(PARENT_SPAN_HEADER),
+        request.headers.get(SAMPLED_HEADER)
+    )
+    if trace_id is None:
+        return await call_next(request)
+    with span("ml_service.request", method=request.method, path=request.url.path):
+        response = await call_next(request)
+    response.headers[TRACE_HEADER] = trace_id
+    return response
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +56,7 @@ async def startup_event():
         if not os.path.exists("data/historical_weather.csv"):
             await fetch_and_save_historical_data()
             train_and_save_model()
+        get_feature_store()
     except Exception as e:
         print(f"Błąd podczas inicjalizacji: {str(e)}")
 
@@ -37,43 +65,94 @@ async def root():
     return {"message": "VentiGlobe ML Service is running"}
 
 @app.get("/predict/{city}")
-async def predict_weather(city: str, date: str = None) -> Dict:
+async def predict_weather(city: str, date: str = None, intervals: bool = False) -> Dict:
     """
     Przewiduje pogodę dla danego miasta na określoną datę.
-    Jeśli data nie jest podana, używa dzisiejszej daty.
+    Jeśli data nie jest podana, używa dzisiejszej daty. Data musi wypadać
+    1-MAX_FORECAST_DAYS dni po ostatniej obserwacji w magazynie cech.
+    Z `intervals=true` zwraca też przedziały p10/p50/p90.
     """
     try:
         target_date = datetime.strptime(date, "%Y-%m-%d") if date else datetime.now()
-        # Współrzędne miast
-        city_coords = {
-            "Warsaw": (52.22977, 21.01178),
-            "Krakow": (50.06143, 19.93658),
-            "Gdansk": (54.35227, 18.64912),
-            "Wroclaw": (51.1, 17.03333)
-        }
-        
-        if city not in city_coords:
-            raise HTTPException(status_code=404, detail=f"Miasto {city} nie jest obsługiwane")
-            
-        lat, lon = city_coords[city]
-        return get_weather_prediction(city, lat, lon, target_date)
-        
     except ValueError:
         raise HTTPException(status_code=400, detail="Nieprawidłowy format daty. Użyj formatu YYYY-MM-DD")
+    
+    if city not in CITY_COORDS:
+        raise HTTPException(status_code=404, detail=f"Miasto {city} nie jest obsługiwane")
+    
+    try:
+        lat, lon = CITY_COORDS[city]
+        return get_weather_prediction(city, lat, lon, target_date,
+                                      DEFAULT_QUANTILES if intervals else None)
+    except ForecastHorizonError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/forecast/{city}")
+async def forecast_weather(city: str,
+                           days: int = Query(7, ge=1, le=MAX_FORECAST_DAYS),
+                           intervals: bool = False) -> Dict:
+    """
+    Prognozuje pogodę dla danego miasta na kolejne `days` dni
+    (predykcje kolejnych dni są cechami wejściowymi dla następnych).
+    Z `intervals=true` każdy dzień zawiera też przedziały p10/p50/p90.
+    """
+    if city not in CITY_COORDS:
+        raise HTTPException(status_code=404, detail=f"Miasto {city} nie jest obsługiwane")
+    
+    try:
+        lat, lon = CITY_COORDS[city]
+        return get_weather_forecast(city, lat, lon, days,
+                                    DEFAULT_QUANTILES if intervals else None)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/features/status")
+async def feature_store_status() -> Dict:
+    """
+    Zwraca wiek ostatnich obserwacji w magazynie cech dla każdego miasta.
+    """
+    try:
+        return get_feature_store().status()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/shards/status")
+async def shards_status() -> Dict:
+    """
+    Zwraca listę wczytanych shardów i zajętą przez nie pamięć.
+    """
+    return shard_router.status()
+
 @app.post("/retrain")
-async def retrain_model() -> Dict:
+async def retrain_model(incremental: bool = False, sharded: bool = False) -> Dict:
     """
     Pobiera nowe dane i trenuje model od nowa.
+    Z `incremental=true` dokłada do lasów drzewa wytrenowane na nowych danych
+    i próbce historii (z pełnym retreningiem przy wykrytym dryfie lub pogorszeniu
+    wyniku na rocznym oknie kontrolnym). Tryb przyrostowy obejmuje
+    tylko model globalny, więc jest odrzucany dla shardów (`sharded=true`
+    lub MODEL_SHARDING=1) - shardy trenuje się zawsze od nowa.
+    Z `sharded=true` trenuje osobne modele dla każdego miasta.
     """
+    if incremental and (sharded or SHARDING_ENABLED):
+        raise HTTPException(
+            status_code=400,
+            detail="Trening przyrostowy obejmuje tylko model globalny. "
+                   "Przy modelach per miasto użyj /retrain?sharded=true."
+        )
+    
     try:
         # Pobierz nowe dane
         await fetch_and_save_historical_data()
         
         # Trenuj model
-        metrics = train_and_save_model()
+        if sharded:
+            metrics = train_and_save_sharded_models()
+            shard_router.invalidate()
+        else:
+            metrics = update_and_save_model() if incremental else train_and_save_model()
         
         return {
             "status": "success",
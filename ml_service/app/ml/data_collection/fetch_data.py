@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 import logging
 import asyncio
 import os
+from app.ml.feature_store.feature_store import update_feature_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -115,6 +116,9 @@ async def fetch_and_save_historical_data(cities: list = CITIES, years: int = 10)
         df.to_csv("data/historical_weather.csv", index=False)
         logger.info(f"Zapisano {len(df)} rekordów do pliku")
         
+        # Odśwież magazyn cech używany przy predykcji
+        update_feature_store(df)
+        
         # Basic data validation
         logger.info("\nStatystyki danych:")
         logger.info(f"Liczba rekordów: {len(df)}")
@@ -4,60 +4,48 @@ from sklearn.preprocessing import StandardScaler
 from typing import Tuple, Dict
 import logging
 import os
+from app.ml.data_preprocessing.validate_data import validate_data, log_report, DataQualityError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_data(file_path: str) -> pd.DataFrame:
+# Cechy wejściowe modelu (kolejność musi być zgodna z treningiem i predykcją)
+FEATURES = [
+    'latitude', 'longitude', 'day_of_year', 'month', 'year',
+    'max_temperature', 'min_temperature', 'max_windspeed',
+    'humidity', 'pressure'
+]
+
+def load_data(file_path: str) -> Tuple[pd.DataFrame, Dict]:
     """
-    Wczytuje dane z pliku CSV i czyści je z wartości NaN.
+    Wczytuje dane z pliku CSV i przepuszcza je przez walidację jakości.
+    Zwraca oczyszczone dane oraz raport jakości.
     """
     try:
         logger.info(f"Wczytuję dane z pliku: {file_path}")
         df = pd.read_csv(file_path)
         logger.info(f"Wczytano {len(df)} wierszy")
-        
-        # Konwersja daty
-        df['date'] = pd.to_datetime(df['date'])
-        logger.info(f"Zakres dat: od {df['date'].min()} do {df['date'].max()}")
-        
-        # Sprawdź brakujące wartości przed czyszczeniem
-        missing_before = df.isna().sum()
-        logger.info("\nBrakujące wartości przed czyszczeniem:")
-        for col, count in missing_before.items():
-            if count > 0:
-                logger.info(f"{col}: {count}")
-        
-        # Usuń wiersze z brakującymi wartościami
-        df = df.dropna()
-        logger.info(f"Usunięto {len(df)} wierszy po usunięciu brakujących wartości")
-        
-        # Usuń duplikaty
-        duplicates = df.duplicated().sum()
-        df = df.drop_duplicates()
-        logger.info(f"Usunięto {duplicates} duplikatów")
-        
-        # Usuń wartości odstające
-        for col in ['max_temperature', 'min_temperature', 'max_windspeed', 
-                   'humidity', 'pressure']:
-            Q1 = df[col].quantile(0.25)
-            Q3 = df[col].quantile(0.75)
-            IQR = Q3 - Q1
-            outliers = ((df[col] < (Q1 - 1.5 * IQR)) | (df[col] > (Q3 + 1.5 * IQR))).sum()
-            df = df[~((df[col] < (Q1 - 1.5 * IQR)) | (df[col] > (Q3 + 1.5 * IQR)))]
-            if outliers > 0:
-                logger.info(f"Usunięto {outliers} wartości odstających dla {col}")
-        
-        logger.info(f"\nStatystyki po czyszczeniu:")
-        logger.info(f"Liczba wierszy: {len(df)}")
-        logger.info(f"Zakres dat: od {df['date'].min()} do {df['date'].max()}")
-        
-        return df
+        return check_quality(df)
         
     except Exception as e:
         logger.error(f"Błąd podczas wczytywania danych: {str(e)}")
         raise
 
+def check_quality(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Waliduje surowe dane i zwraca oczyszczone dane oraz raport jakości.
+    Zgłasza DataQualityError, jeśli utrata wierszy przekracza próg.
+    """
+    df, report = validate_data(df)
+    log_report(report)
+    
+    if not report['passed']:
+        raise DataQualityError(
+            f"Utrata wierszy {report['row_loss']:.2%} przekracza próg {report['max_row_loss']:.2%}"
+        )
+    
+    return df, report
+
 def prepare_features(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     Przygotowuje cechy do treningu modelu.
@@ -70,24 +58,20 @@ def prepare_features(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarr
     df['year'] = df['date'].dt.year
     
     # Wybierz cechy do modelu
-    features = [
-        'latitude', 'longitude', 'day_of_year', 'month', 'year',
-        'max_temperature', 'min_temperature', 'max_windspeed', 
-        'humidity', 'pressure'
-    ]
-    
-    X = df[features].values
-    logger.info(f"Przygotowano {len(X)} próbek z {len(features)} cechami")
+    X = df[FEATURES].values
+    logger.info(f"Przygotowano {len(X)} próbek z {len(FEATURES)} cechami")
     
-    # Przygotuj targety (temperatura na następny dzień)
-    y_max = df['max_temperature'].shift(-1).values[:-1]
-    y_min = df['min_temperature'].shift(-1).values[:-1]
+    # Przygotuj targety (temperatura na następny dzień) - osobno dla każdego miasta,
+    # żeby ostatni wiersz miasta nie dostał targetu z kolejnego miasta
+    next_day = df.groupby('city', sort=False)[['date', 'max_temperature', 'min_temperature']].shift(-1)
+    y_max = next_day['max_temperature'].values
+    y_min = next_day['min_temperature'].values
+    next_date = next_day['date']
     
-    # Usuń ostatni wiersz z X, ponieważ nie mamy targetu dla następnego dnia
-    X = X[:-1]
-    
-    # Usuń wiersze z NaN w targetach
-    mask = ~np.isnan(y_max) & ~np.isnan(y_min)
+    # Zostaw tylko pary, w których target jest dokładnie z dnia date+1
+    # (luki po usuniętych wierszach i ostatni wiersz miasta nie mają targetu)
+    consecutive = ((next_date - df['date']).dt.days == 1).values
+    mask = consecutive & ~np.isnan(y_max) & ~np.isnan(y_min)
     X = X[mask]
     y_max = y_max[mask]
     y_min = y_min[mask]
@@ -105,50 +89,61 @@ def scale_features(X: np.ndarray) -> Tuple[np.ndarray, StandardScaler]:
     logger.info("Cechy zostały przeskalowane")
     return X_scaled, scaler
 
-def split_data(X: np.ndarray, y_max: np.ndarray, y_min: np.ndarray, test_size: float = 0.2) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+def split_by_date(df: pd.DataFrame, test_size: float = 0.2) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Timestamp]:
     """
-    Dzieli dane na zbiór treningowy i testowy.
+    Dzieli dane na zbiór treningowy i testowy według daty: ostatnie `test_size`
+    dni (wspólne dla wszystkich miast) trafiają do zbioru testowego, więc metryki
+    testowe obejmują wszystkie miasta w tym samym okresie.
+    Zwraca (dane treningowe, dane testowe, pierwszy dzień zbioru testowego).
     """
     logger.info("\nDzielenie danych na zbiory treningowy i testowy...")
-    split_idx = int(len(X) * (1 - test_size))
-    X_train, X_test = X[:split_idx], X[split_idx:]
-    y_train_max, y_test_max = y_max[:split_idx], y_max[split_idx:]
-    y_train_min, y_test_min = y_min[:split_idx], y_min[split_idx:]
-    logger.info(f"Zbiór treningowy: {len(X_train)} próbek")
-    logger.info(f"Zbiór testowy: {len(X_test)} próbek")
-    return X_train, X_test, y_train_max, y_test_max, y_train_min, y_test_min
+    dates = np.sort(df['date'].unique())
+    test_start = pd.Timestamp(dates[int(len(dates) * (1 - test_size))])
+    train_df = df[df['date'] < test_start].copy()
+    test_df = df[df['date'] >= test_start].copy()
+    logger.info(f"Zbiór testowy od {test_start.strftime('%Y-%m-%d')}")
+    return train_df, test_df, test_start
+
+def build_training_data(df: pd.DataFrame, quality_report: Dict, test_size: float = 0.2) -> Dict:
+    """
+    Przygotowuje cechy, targety i skaler z oczyszczonych danych.
+    Skaler dopasowywany jest tylko do zbioru treningowego.
+    """
+    train_df, test_df, test_start = split_by_date(df, test_size)
+    
+    # Przygotuj cechy i targety
+    X_train, y_train_max, y_train_min = prepare_features(train_df)
+    X_test, y_test_max, y_test_min = prepare_features(test_df)
+    
+    # Skaluj cechy
+    X_train, scaler = scale_features(X_train)
+    X_test = scaler.transform(X_test)
+    
+    logger.info("\nPodsumowanie przygotowania danych:")
+    logger.info(f"Liczba próbek treningowych: {len(X_train)}")
+    logger.info(f"Liczba próbek testowych: {len(X_test)}")
+    logger.info(f"Liczba cech: {X_train.shape[1]}")
+    
+    return {
+        'X_train': X_train,
+        'X_test': X_test,
+        'y_train_max': y_train_max,
+        'y_test_max': y_test_max,
+        'y_train_min': y_train_min,
+        'y_test_min': y_test_min,
+        'scaler': scaler,
+        'quality_report': quality_report,
+        'test_start': test_start.strftime('%Y-%m-%d')
+    }
 
 def prepare_training_data(file_path: str) -> Dict:
     """
     Przygotowuje dane do treningu modelu.
     """
     try:
-        # Wczytaj dane
-        df = load_data(file_path)
-        
-        # Przygotuj cechy i targety
-        X, y_max, y_min = prepare_features(df)
-        
-        # Skaluj cechy
-        X_scaled, scaler = scale_features(X)
-        
-        # Podziel dane
-        X_train, X_test, y_train_max, y_test_max, y_train_min, y_test_min = split_data(X_scaled, y_max, y_min)
-        
-        logger.info("\nPodsumowanie przygotowania danych:")
-        logger.info(f"Liczba próbek treningowych: {len(X_train)}")
-        logger.info(f"Liczba próbek testowych: {len(X_test)}")
-        logger.info(f"Liczba cech: {X_train.shape[1]}")
-        
-        return {
-            'X_train': X_train,
-            'X_test': X_test,
-            'y_train_max': y_train_max,
-            'y_test_max': y_test_max,
-            'y_train_min': y_train_min,
-            'y_test_min': y_test_min,
-            'scaler': scaler
-        }
+        # Wczytaj i zwaliduj dane
+        df, quality_report = load_data(file_path)
+        return build_training_data(df, quality_report)
         
     except Exception as e:
         logger.error(f"Błąd podczas przygotowywania danych: {str(e)}")
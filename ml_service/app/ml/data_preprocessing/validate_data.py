@@ -0,0 +1,160 @@
+import pandas as pd
+import numpy as np
+from typing import Tuple, Dict, Optional
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Wymagane kolumny danych historycznych
+REQUIRED_COLUMNS = [
+    'city', 'latitude', 'longitude', 'date',
+    'max_temperature', 'min_temperature', 'max_windspeed',
+    'humidity', 'pressure'
+]
+
+# Fizycznie dopuszczalne zakresy wartości
+VALUE_RANGES = {
+    'latitude': (-90.0, 90.0),
+    'longitude': (-180.0, 180.0),
+    'max_temperature': (-90.0, 60.0),
+    'min_temperature': (-90.0, 60.0),
+    'max_windspeed': (0.0, 400.0),
+    'humidity': (0.0, 100.0),
+    'pressure': (850.0, 1090.0)
+}
+
+# Kolumny sprawdzane pod kątem wartości odstających (IQR liczone osobno dla każdego miasta)
+OUTLIER_COLUMNS = ['max_temperature', 'min_temperature', 'max_windspeed', 'humidity', 'pressure']
+
+# Mnożnik IQR dla wartości odstających zgłaszanych w raporcie
+OUTLIER_IQR_FACTOR = 1.5
+
+# Mnożnik IQR, powyżej którego wiersze są usuwane (None - wartości odstające tylko raportowane,
+# bo przy 1.5 x IQR są to głównie prawdziwe ekstrema pogodowe, a nie błędne dane)
+OUTLIER_DROP_FACTOR = None
+
+# Maksymalny odsetek usuniętych wierszy, powyżej którego trening jest wstrzymywany
+MAX_ROW_LOSS = 0.10
+
+class DataQualityError(Exception):
+    """
+    Dane nie spełniają wymagań jakościowych do treningu.
+    """
+
+def validate_data(df: pd.DataFrame,
+                  max_row_loss: float = MAX_ROW_LOSS,
+                  iqr_factor: float = OUTLIER_IQR_FACTOR,
+                  outlier_drop_factor: Optional[float] = OUTLIER_DROP_FACTOR) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Sprawdza jakość danych i usuwa nieprawidłowe wiersze.
+    Wszystkie kontrole (schemat, zakresy, duplikaty, wartości odstające per miasto,
+    luki w datach per miasto, utrata wierszy) są wektorowe - bez pętli po wierszach.
+    Usuwane są tylko wiersze z brakami, wartościami poza zakresem i duplikaty;
+    wartości odstające są raportowane (usuwane tylko przy `outlier_drop_factor`).
+    Zwraca oczyszczone dane oraz raport.
+    """
+    start = time.perf_counter()
+    rows_in = len(df)
+
+    # Schemat
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise DataQualityError(f"Brak wymaganych kolumn: {missing_columns}")
+
+    numeric_columns = list(VALUE_RANGES)
+    df = df.copy()
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce')
+
+    # Brakujące (lub nieparsowalne) wartości
+    missing = df[REQUIRED_COLUMNS].isna()
+    missing_mask = missing.any(axis=1).to_numpy()
+
+    # Zakresy wartości
+    values = df[numeric_columns].to_numpy(dtype=float)
+    lower = np.array([VALUE_RANGES[col][0] for col in numeric_columns])
+    upper = np.array([VALUE_RANGES[col][1] for col in numeric_columns])
+    out_of_range = (values < lower) | (values > upper)
+    min_above_max = (df['min_temperature'] > df['max_temperature']).to_numpy()
+    range_mask = out_of_range.any(axis=1) | min_above_max
+
+    # Duplikaty (miasto, data)
+    duplicate_mask = df.duplicated(['city', 'date']).to_numpy()
+
+    # Wartości odstające liczone w obrębie miasta
+    grouped = df[OUTLIER_COLUMNS].groupby(df['city'])
+    q1 = grouped.transform('quantile', 0.25)
+    q3 = grouped.transform('quantile', 0.75)
+    iqr = q3 - q1
+    outliers = (df[OUTLIER_COLUMNS] < q1 - iqr_factor * iqr) | (df[OUTLIER_COLUMNS] > q3 + iqr_factor * iqr)
+    if outlier_drop_factor is not None:
+        extreme = ((df[OUTLIER_COLUMNS] < q1 - outlier_drop_factor * iqr) |
+                   (df[OUTLIER_COLUMNS] > q3 + outlier_drop_factor * iqr))
+        outlier_mask = extreme.any(axis=1).to_numpy()
+    else:
+        outlier_mask = np.zeros(rows_in, dtype=bool)
+
+    keep = ~(missing_mask | range_mask | duplicate_mask | outlier_mask)
+    clean = df[keep]
+
+    # Luki w datach per miasto w danych źródłowych (przed czyszczeniem)
+    ordered = (df.loc[df['city'].notna() & df['date'].notna(), ['city', 'date']]
+               .drop_duplicates()
+               .sort_values(['city', 'date']))
+    step_days = ordered.groupby('city')['date'].diff().dt.days
+    gaps = step_days > 1
+    gap_stats = (step_days[gaps] - 1).groupby(ordered['city'][gaps]).agg(['count', 'sum'])
+
+    rows_out = len(clean)
+    row_loss = 1 - rows_out / rows_in if rows_in else 1.0
+
+    report = {
+        'rows_in': int(rows_in),
+        'rows_out': int(rows_out),
+        'row_loss': round(float(row_loss), 4),
+        'max_row_loss': max_row_loss,
+        'passed': bool(rows_out > 0 and row_loss <= max_row_loss),
+        'dropped_rows': {
+            'missing_values': int(missing_mask.sum()),
+            'out_of_range': int(range_mask.sum()),
+            'duplicates': int(duplicate_mask.sum()),
+            'outliers': int(outlier_mask.sum())
+        },
+        'checks': {
+            'missing_values': {col: int(n) for col, n in missing.sum().items() if n > 0},
+            'out_of_range': {
+                **{col: int(n) for col, n in zip(numeric_columns, out_of_range.sum(axis=0)) if n > 0},
+                'min_above_max_temperature': int(min_above_max.sum())
+            },
+            'duplicates': int(duplicate_mask.sum()),
+            'outliers': {col: int(n) for col, n in outliers.sum().items() if n > 0},
+            'date_gaps': {
+                city: {'gaps': int(row['count']), 'missing_days': int(row['sum'])}
+                for city, row in gap_stats.iterrows()
+            }
+        },
+        'date_range': {
+            'start': clean['date'].min().strftime('%Y-%m-%d') if rows_out else None,
+            'end': clean['date'].max().strftime('%Y-%m-%d') if rows_out else None
+        },
+        'duration_seconds': round(time.perf_counter() - start, 4)
+    }
+
+    return clean, report
+
+def log_report(report: Dict) -> None:
+    """
+    Wypisuje podsumowanie raportu jakości danych.
+    """
+    checks = report['checks']
+    logger.info("\nRaport jakości danych:")
+    logger.info(f"Wiersze: {report['rows_in']} -> {report['rows_out']} (utrata {report['row_loss']:.2%})")
+    logger.info(f"Usunięte wiersze wg przyczyny: {report['dropped_rows']}")
+    logger.info(f"Brakujące wartości: {checks['missing_values']}")
+    logger.info(f"Poza zakresem: {checks['out_of_range']}")
+    logger.info(f"Duplikaty: {checks['duplicates']}")
+    logger.info(f"Wartości odstające (bez usuwania): {checks['outliers']}")
+    logger.info(f"Luki w datach: {checks['date_gaps']}")
+    logger.info(f"Czas walidacji: {report['duration_seconds']:.3f}s")
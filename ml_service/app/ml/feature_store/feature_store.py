@@ -0,0 +1,155 @@
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Optional
+import logging
+import os
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Kolumny przechowywane dla każdego miasta (jak w data/historical_weather.csv)
+OBSERVATION_COLUMNS = [
+    'city', 'latitude', 'longitude', 'date',
+    'max_temperature', 'min_temperature', 'max_windspeed',
+    'humidity', 'pressure'
+]
+
+# Dane przykładowe dla trybu offline (FEATURE_STORE=stub)
+STUB_OBSERVATIONS = [
+    {'city': 'Warsaw', 'latitude': 52.22977, 'longitude': 21.01178},
+    {'city': 'Krakow', 'latitude': 50.06143, 'longitude': 19.93658},
+    {'city': 'Gdansk', 'latitude': 54.35227, 'longitude': 18.64912},
+    {'city': 'Wroclaw', 'latitude': 51.1, 'longitude': 17.03333}
+]
+
+class FeatureStore:
+    """
+    Przechowuje w pamięci ostatnią zaobserwowaną dzienną obserwację dla każdego miasta.
+    Odczyt dla miasta jest O(1) (słownik), a aktualizacja podmienia cały słownik,
+    więc czytelnicy nigdy nie widzą stanu częściowego.
+    """
+    def __init__(self):
+        self._rows: Dict[str, Dict] = {}
+        self._updated_at: Dict[str, datetime] = {}
+
+    def load(self, data_path: str = "data/historical_weather.csv") -> None:
+        """
+        Wczytuje najnowsze obserwacje z historycznego pliku CSV.
+        """
+        try:
+            self.update(pd.read_csv(data_path))
+        except Exception as e:
+            logger.error(f"Błąd podczas wczytywania magazynu cech: {str(e)}")
+            raise
+
+    def update(self, df: pd.DataFrame) -> None:
+        """
+        Aktualizuje magazyn nowymi obserwacjami (np. po pobraniu danych).
+        Starsze obserwacje niż już przechowywane są ignorowane.
+        """
+        df = df[OBSERVATION_COLUMNS].dropna().copy()
+        df['date'] = pd.to_datetime(df['date'])
+        latest = df.sort_values('date').groupby('city', sort=False).tail(1)
+
+        rows = dict(self._rows)
+        updated_at = dict(self._updated_at)
+        now = datetime.now()
+        for record in latest.to_dict('records'):
+            current = rows.get(record['city'])
+            if current is None or record['date'] >= current['date']:
+                rows[record['city']] = record
+                updated_at[record['city']] = now
+
+        self._rows = rows
+        self._updated_at = updated_at
+        logger.info(f"Magazyn cech zawiera obserwacje dla {len(rows)} miast")
+
+    def get(self, city: str) -> Optional[Dict]:
+        """
+        Zwraca ostatnią obserwację dla miasta lub None.
+        """
+        return self._rows.get(city)
+
+    def get_many(self, cities: List[str]) -> pd.DataFrame:
+        """
+        Zwraca ostatnie obserwacje dla wielu miast jako DataFrame (pomija nieznane miasta).
+        """
+        return pd.DataFrame(
+            [self._rows[city] for city in cities if city in self._rows],
+            columns=OBSERVATION_COLUMNS
+        )
+
+    def age_days(self, city: str, now: Optional[datetime] = None) -> Optional[int]:
+        """
+        Zwraca wiek ostatniej obserwacji dla miasta w dniach lub None.
+        """
+        row = self._rows.get(city)
+        if row is None:
+            return None
+        return ((now or datetime.now()) - row['date']).days
+
+    def status(self) -> Dict[str, Dict]:
+        """
+        Zwraca datę obserwacji, wiek danych i czas ostatniej aktualizacji dla każdego miasta.
+        """
+        now = datetime.now()
+        return {
+            city: {
+                'observation_date': row['date'].strftime('%Y-%m-%d'),
+                'age_days': self.age_days(city, now),
+                'updated_at': self._updated_at[city].isoformat(timespec='seconds')
+            }
+            for city, row in self._rows.items()
+        }
+
+class StubFeatureStore(FeatureStore):
+    """
+    Magazyn cech z danymi przykładowymi, nie wymaga plików ani sieci.
+    """
+    def load(self, data_path: str = None) -> None:
+        # Pełna dzienna obserwacja jest dostępna najwcześniej dla wczorajszego dnia
+        yesterday = pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=1)
+        self.update(pd.DataFrame([
+            {
+                **city,
+                'date': yesterday,
+                'max_temperature': 20.0,
+                'min_temperature': 15.0,
+                'max_windspeed': 15.0,
+                'humidity': 65.0,
+                'pressure': 1013.0
+            }
+            for city in STUB_OBSERVATIONS
+        ]))
+
+_feature_store: Optional[FeatureStore] = None
+
+def _create_feature_store() -> FeatureStore:
+    """
+    Tworzy pusty magazyn cech. Zmienna środowiskowa FEATURE_STORE=stub włącza dane przykładowe.
+    """
+    return StubFeatureStore() if os.getenv("FEATURE_STORE") == "stub" else FeatureStore()
+
+def get_feature_store() -> FeatureStore:
+    """
+    Zwraca współdzielony magazyn cech, wczytując go przy pierwszym użyciu.
+    """
+    global _feature_store
+    if _feature_store is None:
+        store = _create_feature_store()
+        store.load()
+        _feature_store = store
+    return _feature_store
+
+def update_feature_store(df: pd.DataFrame) -> None:
+    """
+    Aktualizuje współdzielony magazyn cech nowymi obserwacjami. Jeśli magazyn
+    nie był jeszcze używany, jest budowany bezpośrednio z `df` (bez wczytywania CSV).
+    """
+    global _feature_store
+    if _feature_store is None:
+        store = _create_feature_store()
+        store.update(df)
+        _feature_store = store
+    else:
+        _feature_store.update(df)
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+import logging
+import time
+from typing import Callable, Dict, List
+from sklearn.preprocessing import StandardScaler
+from .train_model import WeatherModel, INCREMENTAL_TREES, HOLDOUT_DAYS, sample_history
+from .predict import predict_with_intervals, DEFAULT_QUANTILES
+from app.ml.data_preprocessing.prepare_data import FEATURES, load_data, prepare_features
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _best_time(fn: Callable, repeats: int) -> float:
+    """
+    Zwraca najkrótszy czas wykonania `fn` z `repeats` prób (w sekundach).
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def sample_features(data_path: str, scaler, n: int, seed: int = 42) -> np.ndarray:
+    """
+    Losuje `n` przeskalowanych wierszy cech z danych historycznych.
+    """
+    df = pd.read_csv(data_path).dropna()
+    df['date'] = pd.to_datetime(df['date'])
+    df['day_of_year'] = df['date'].dt.dayofyear
+    df['month'] = df['date'].dt.month
+    df['year'] = df['date'].dt.year
+    rows = df[FEATURES].sample(n, replace=True, random_state=seed).to_numpy(dtype=float)
+    return scaler.transform(rows)
+
+def benchmark_intervals(model_dir: str = "models",
+                        data_path: str = "data/historical_weather.csv",
+                        batch_sizes: List[int] = [1, 4, 100, 10000],
+                        repeats: int = 20) -> List[Dict]:
+    """
+    Porównuje czas predykcji punktowej (forest.predict) z predykcją z przedziałami
+    (predict_with_intervals) dla obu modeli temperatury.
+    """
+    model = WeatherModel()
+    model.load(model_dir)
+    forests = [model.max_temp_model, model.min_temp_model]
+
+    results = []
+    for n in batch_sizes:
+        X = sample_features(data_path, model.scaler, n)
+        point = _best_time(lambda: [forest.predict(X) for forest in forests], repeats)
+        intervals = _best_time(
+            lambda: [predict_with_intervals(forest, X, DEFAULT_QUANTILES) for forest in forests], repeats
+        )
+        results.append({
+            'batch_size': n,
+            'point_ms': point * 1000,
+            'intervals_ms': intervals * 1000,
+            'overhead': intervals / point
+        })
+        logger.info(f"n={n}: predict {point * 1000:.2f} ms, "
+                    f"przedziały {intervals * 1000:.2f} ms ({intervals / point:.2f}x)")
+    return results
+
+def _fit_full(X: np.ndarray, y_max: np.ndarray, y_min: np.ndarray) -> WeatherModel:
+    """
+    Trenuje od zera nowy model (ze skalerem) na podanych danych.
+    """
+    model = WeatherModel()
+    model.scaler = StandardScaler().fit(X)
+    X_scaled = model.scaler.transform(X)
+    model.max_temp_model.fit(X_scaled, y_max)
+    model.min_temp_model.fit(X_scaled, y_min)
+    return model
+
+def benchmark_incremental(data_path: str = "data/historical_weather.csv",
+                          recent_days: int = 30,
+                          test_days: int = 30,
+                          holdout_days: int = HOLDOUT_DAYS,
+                          n_new_trees: int = INCREMENTAL_TREES) -> Dict:
+    """
+    Porównuje aktualizację przyrostową z pełnym retreningiem.
+    Oś czasu (od końca danych): `test_days` dni testu, `recent_days` nowych dni,
+    `holdout_days` dni okna kontrolnego i wcześniejsza historia. Model bazowy
+    widzi tylko historię; następnie dostaje nowe dni przez dołożenie drzew
+    (na nowych dniach z próbką historii albo - dla porównania - tylko na nowych
+    dniach) lub przez pełny retrening na historii i nowych dniach.
+    Wszystkie warianty oceniane są na ostatnich `test_days` dniach (ta sama pora
+    roku co nowe dni) i na oknie kontrolnym obejmującym pełny rok, którego
+    nie widział żaden model.
+    """
+    df, _ = load_data(data_path)
+    test_start = df['date'].max() - pd.Timedelta(days=test_days)
+    update_start = test_start - pd.Timedelta(days=recent_days)
+    holdout_start = update_start - pd.Timedelta(days=holdout_days)
+    
+    # prepare_features łączy w pary tylko kolejne dni tego samego miasta,
+    # więc granice wycinków i miast nie tworzą fałszywych targetów
+    history = df[df['date'] < holdout_start]
+    recent = df[(df['date'] >= update_start - pd.Timedelta(days=1)) & (df['date'] < test_start)]
+    X_base, y_base_max, y_base_min = prepare_features(history.copy())
+    X_new, y_new_max, y_new_min = prepare_features(recent.copy())
+    X_all, y_all_max, y_all_min = prepare_features(pd.concat([history, recent]))
+    windows = {
+        'recent': prepare_features(df[df['date'] >= test_start].copy()),
+        'year': prepare_features(df[(df['date'] >= holdout_start) & (df['date'] < update_start)].copy())
+    }
+    X_hist, y_hist_max, y_hist_min = sample_history(X_base, y_base_max, y_base_min)
+    
+    start = time.perf_counter()
+    full = _fit_full(X_all, y_all_max, y_all_min)
+    full_seconds = time.perf_counter() - start
+    
+    models = {'full': (full, full_seconds)}
+    for mode, (X_fit, y_fit_max, y_fit_min) in (
+        ('incremental', (np.vstack([X_new, X_hist]),
+                         np.concatenate([y_new_max, y_hist_max]),
+                         np.concatenate([y_new_min, y_hist_min]))),
+        ('incremental_new_only', (X_new, y_new_max, y_new_min))
+    ):
+        model = _fit_full(X_base, y_base_max, y_base_min)
+        start = time.perf_counter()
+        model.train_incremental(model.scaler.transform(X_fit), y_fit_max, y_fit_min, n_new_trees)
+        models[mode] = (model, time.perf_counter() - start)
+    
+    result = {'new_samples': len(X_new), 'history_samples': len(X_hist)}
+    for mode, (model, seconds) in models.items():
+        result[mode] = {
+            'seconds': seconds,
+            'metrics': {
+                window: model.evaluate(model.scaler.transform(X), y_max, y_min)
+                for window, (X, y_max, y_min) in windows.items()
+            }
+        }
+        for window, metrics in result[mode]['metrics'].items():
+            logger.info(f"{mode} ({window}): {seconds:.2f}s, "
+                        f"RMSE max {metrics['max_temp']['rmse']:.2f}°C, "
+                        f"RMSE min {metrics['min_temp']['rmse']:.2f}°C")
+    return result
+
+if __name__ == "__main__":
+    benchmark_intervals()
+    benchmark_incremental()
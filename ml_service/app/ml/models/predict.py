@@ -1,179 +1,346 @@
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
-from typing import Dict, List, Tuple
-from .train_model import WeatherModel
+from typing import Dict, List, Tuple, Optional
+from collections import OrderedDict
+from .train_model import WeatherModel, SHARD_DIR
+from app.ml.data_preprocessing.prepare_data import FEATURES
+from app.ml.feature_store.feature_store import get_feature_store
+from app.tracing import span
 import os
-import joblib
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Indeksy kolumn w macierzy cech, aktualizowane w kolejnych krokach prognozy
+DAY_OF_YEAR_IDX = FEATURES.index('day_of_year')
+MONTH_IDX = FEATURES.index('month')
+YEAR_IDX = FEATURES.index('year')
+MAX_TEMP_IDX = FEATURES.index('max_temperature')
+MIN_TEMP_IDX = FEATURES.index('min_temperature')
+
+# Modele per miasto (shardy): włączane przez MODEL_SHARDING=1
+SHARDING_ENABLED = os.getenv("MODEL_SHARDING", "0") == "1"
+SHARD_MEMORY_BUDGET_MB = float(os.getenv("SHARD_MEMORY_BUDGET_MB", "512"))
+
+# Domyślne kwantyle przedziałów predykcji (p10/p50/p90)
+DEFAULT_QUANTILES = [0.1, 0.5, 0.9]
+
+# Maksymalny horyzont prognozy (błąd autoregresji rośnie z każdym krokiem);
+# ta sama zmienna środowiskowa ogranicza parametr `days` w backendzie
+MAX_FORECAST_DAYS = int(os.getenv("MAX_FORECAST_DAYS", "14"))
+
+# Wiek ostatniej obserwacji (w dniach), powyżej którego odpowiedź oznaczana jest jako nieaktualna
+MAX_OBSERVATION_AGE_DAYS = int(os.getenv("MAX_OBSERVATION_AGE_DAYS", "3"))
+
+class ForecastHorizonError(ValueError):
+    """
+    Data predykcji nie mieści się w horyzoncie od ostatniej obserwacji.
+    """
+
+def predict_with_intervals(forest, X: np.ndarray, quantiles: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Wylicza predykcję punktową i kwantyle z predykcji poszczególnych drzew lasu.
+    Predykcje drzew trafiają do jednej macierzy (drzewa x próbki), z której
+    średnia (równa forest.predict) i kwantyle liczone są wektorowo w jednym przebiegu.
+    Zwraca (średnia [n], kwantyle [len(quantiles), n]).
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    per_tree = np.empty((len(forest.estimators_), len(X)))
+    for i, tree in enumerate(forest.estimators_):
+        per_tree[i] = tree.predict(X, check_input=False)
+    return per_tree.mean(axis=0), np.quantile(per_tree, quantiles, axis=0)
+
+def format_intervals(quantiles: List[float], values: np.ndarray) -> Dict[str, float]:
+    """
+    Zamienia wektor kwantyli na słownik {"p10": ..., "p50": ..., "p90": ...}.
+    """
+    return {f"p{round(q * 100):g}": float(v) for q, v in zip(quantiles, values)}
+
+class ShardRouter:
+    """
+    Wybiera model (shard) dla miasta. Shardy są wczytywane leniwie przy pierwszym
+    żądaniu i usuwane z pamięci w kolejności LRU, gdy łączny rozmiar wczytanych
+    shardów przekroczy budżet. Rozmiar shardu szacowany jest rozmiarem jego plików.
+    """
+    def __init__(self, shard_dir: str = SHARD_DIR, memory_budget_mb: float = SHARD_MEMORY_BUDGET_MB):
+        self.shard_dir = shard_dir
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._shards: "OrderedDict[str, Tuple[WeatherModel, int]]" = OrderedDict()
+        self._loaded_bytes = 0
+    
+    def get(self, city: str) -> Optional[WeatherModel]:
+        """
+        Zwraca shard dla miasta lub None, jeśli shard nie został wytrenowany.
+        """
+        if city in self._shards:
+            self._shards.move_to_end(city)
+            return self._shards[city][0]
+        
+        path = os.path.join(self.shard_dir, city)
+        if not os.path.exists(os.path.join(path, 'max_temp_model.joblib')):
+            return None
+        
+        model = WeatherModel()
+        model.load(path)
+        size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        self._shards[city] = (model, size)
+        self._loaded_bytes += size
+        
+        # Zwolnij najdawniej używane shardy (poza właśnie wczytanym)
+        while self._loaded_bytes > self.memory_budget and len(self._shards) > 1:
+            evicted, (_, evicted_size) = self._shards.popitem(last=False)
+            self._loaded_bytes -= evicted_size
+            logger.info(f"Usunięto z pamięci shard dla miasta {evicted}")
+        
+        return model
+    
+    def invalidate(self) -> None:
+        """
+        Usuwa wszystkie wczytane shardy (np. po ponownym treningu).
+        """
+        self._shards.clear()
+        self._loaded_bytes = 0
+    
+    def status(self) -> Dict:
+        return {
+            'loaded': list(self._shards),
+            'loaded_mb': round(self._loaded_bytes / 1024 / 1024, 2),
+            'memory_budget_mb': round(self.memory_budget / 1024 / 1024, 2)
+        }
+
+shard_router = ShardRouter()
+
+def load_model(city: str, model_dir: str = "models") -> WeatherModel:
+    """
+    Zwraca model dla miasta: shard (gdy MODEL_SHARDING=1 i shard istnieje)
+    albo model globalny. Jedyne miejsce wyboru modelu dla predykcji i prognoz.
+    """
+    if SHARDING_ENABLED:
+        shard = shard_router.get(city)
+        if shard is not None:
+            return shard
+    
+    # Sprawdź czy modele istnieją
+    for name in ('max_temp_model.joblib', 'min_temp_model.joblib', 'scaler.joblib'):
+        if not os.path.exists(os.path.join(model_dir, name)):
+            raise FileNotFoundError("Modele nie zostały jeszcze wytrenowane. Użyj endpointu /retrain aby wytrenować modele.")
+    
+    model = WeatherModel()
+    model.load(model_dir)
+    return model
+
 class WeatherPredictor:
-    def __init__(self, model_dir: str = "models"):
+    def __init__(self, model_dir: str = "models", model: Optional[WeatherModel] = None):
         """
-        Inicjalizuje predyktor pogodowy.
+        Inicjalizuje predyktor pogodowy (z podanym modelem lub modelem z `model_dir`).
         """
-        self.model = WeatherModel()
-        self.model.load(model_dir)
+        if model is None:
+            model = WeatherModel()
+            model.load(model_dir)
+        self.model = model
     
-    def prepare_input_features(self, 
-                             latitude: float,
-                             longitude: float,
-                             date: datetime,
-                             current_weather: Dict) -> np.ndarray:
-        """
-        Przygotowuje cechy wejściowe do predykcji.
-        """
-        features = np.array([[
-            latitude,
-            longitude,
-            date.dayofyear,
-            date.month,
-            date.year,
-            current_weather['max_temperature'],
-            current_weather['min_temperature'],
-            current_weather['precipitation_probability'],
-            current_weather['max_windspeed'],
-            current_weather['humidity'],
-            current_weather['pressure']
-        ]])
-        
-        # Skaluj cechy
-        return self.model.scaler.transform(features)
+    def prepare_input_features(self, current_weather: pd.DataFrame) -> np.ndarray:
+        """
+        Przygotowuje (nieskalowaną) macierz cech dla wielu miast naraz.
+        Każdy wiersz `current_weather` to ostatnia znana obserwacja dla miasta
+        (kolumny jak w data/historical_weather.csv).
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(current_weather['date']))
+        frame = current_weather.assign(
+            day_of_year=dates.dayofyear,
+            month=dates.month,
+            year=dates.year
+        )
+        return frame[FEATURES].to_numpy(dtype=float)
     
-    def predict_next_day(self,
-                        latitude: float,
-                        longitude: float,
-                        current_weather: Dict) -> Dict:
+    def forecast(self,
+                 current_weather: pd.DataFrame,
+                 days: int = 7,
+                 quantiles: Optional[List[float]] = None) -> Dict[str, List[Dict]]:
         """
-        Wykonuje predykcję pogody na następny dzień.
+        Autoregresyjna prognoza na `days` dni dla wszystkich miast z `current_weather`.
+        W każdym kroku predykcja wykonywana jest jednym wywołaniem modelu dla
+        wszystkich miast, a przewidziane temperatury max/min stają się cechami
+        dla kolejnego dnia. Pozostałe cechy (wiatr, wilgotność, ciśnienie)
+        pozostają na poziomie ostatniej obserwacji.
+        Jeśli podano `quantiles`, każdy dzień zawiera też przedziały z drzew lasu
+        (warunkowe względem średniej trajektorii z poprzednich kroków).
         """
         try:
-            # Przygotuj datę na następny dzień
-            next_day = datetime.now() + timedelta(days=1)
+            if days < 1:
+                raise ValueError("Liczba dni prognozy musi być dodatnia")
             
-            # Przygotuj cechy
-            features = self.prepare_input_features(
-                latitude=latitude,
-                longitude=longitude,
-                date=next_day,
-                current_weather=current_weather
-            )
+            X = self.prepare_input_features(current_weather)
+            start_dates = pd.to_datetime(current_weather['date']).to_numpy(dtype='datetime64[D]')
+            max_preds = np.empty((days, len(X)))
+            min_preds = np.empty((days, len(X)))
+            if quantiles:
+                max_intervals = np.empty((days, len(quantiles), len(X)))
+                min_intervals = np.empty((days, len(quantiles), len(X)))
+            
+            for step in range(days):
+                # Cechy z dnia `step` służą do przewidzenia dnia `step + 1`
+                feature_dates = pd.DatetimeIndex(start_dates + np.timedelta64(step, 'D'))
+                X[:, DAY_OF_YEAR_IDX] = feature_dates.dayofyear
+                X[:, MONTH_IDX] = feature_dates.month
+                X[:, YEAR_IDX] = feature_dates.year
+                
+                with span("scaling", step=step):
+                    scaled = self.model.scaler.transform(X)
+                with span("forest_predict", step=step, rows=len(X), intervals=bool(quantiles)):
+                    if quantiles:
+                        max_preds[step], max_intervals[step] = predict_with_intervals(
+                            self.model.max_temp_model, scaled, quantiles)
+                        min_preds[step], min_intervals[step] = predict_with_intervals(
+                            self.model.min_temp_model, scaled, quantiles)
+                    else:
+                        max_preds[step] = self.model.max_temp_model.predict(scaled)
+                        min_preds[step] = self.model.min_temp_model.predict(scaled)
+                
+                X[:, MAX_TEMP_IDX] = max_preds[step]
+                X[:, MIN_TEMP_IDX] = min_preds[step]
             
-            # Wykonaj predykcje
-            temp_pred = self.model.temperature_model.predict(features)[0]
-            precip_pred = self.model.precipitation_model.predict(features)[0]
+            forecast_dates = start_dates[None, :] + np.arange(1, days + 1)[:, None].astype('timedelta64[D]')
             
-            # Przygotuj wynik
-            prediction = {
-                'date': next_day.strftime('%Y-%m-%d'),
-                'predicted_max_temperature': round(temp_pred, 2),
-                'predicted_precipitation_probability': round(precip_pred, 2),
-                'location': {
-                    'latitude': latitude,
-                    'longitude': longitude
-                }
-            }
+            result = {}
+            for i, city in enumerate(current_weather['city']):
+                result[city] = []
+                for step in range(days):
+                    day = {
+                        'date': str(forecast_dates[step, i]),
+                        'predicted_max_temperature': float(max_preds[step, i]),
+                        'predicted_min_temperature': float(min_preds[step, i])
+                    }
+                    if quantiles:
+                        day['max_temperature_interval'] = format_intervals(quantiles, max_intervals[step, :, i])
+                        day['min_temperature_interval'] = format_intervals(quantiles, min_intervals[step, :, i])
+                    result[city].append(day)
             
-            return prediction
+            return result
             
         except Exception as e:
-            logger.error(f"Błąd podczas wykonywania predykcji: {str(e)}")
+            logger.error(f"Błąd podczas wykonywania prognozy wielodniowej: {str(e)}")
             raise
     
+    def predict_next_day(self,
+                        city: str,
+                        latitude: float,
+                        longitude: float,
+                        current_weather: Dict) -> Dict:
+        """
+        Wykonuje predykcję pogody na następny dzień.
+        """
+        return self.predict_next_days(city, latitude, longitude, current_weather, days=1)[0]
+    
     def predict_next_week(self,
+                         city: str,
                          latitude: float,
                          longitude: float,
                          current_weather: Dict) -> List[Dict]:
         """
         Wykonuje predykcję pogody na następny tydzień.
         """
-        try:
-            predictions = []
-            current_date = datetime.now()
-            
-            for day in range(1, 8):
-                next_day = current_date + timedelta(days=day)
-                
-                # Przygotuj cechy
-                features = self.prepare_input_features(
-                    latitude=latitude,
-                    longitude=longitude,
-                    date=next_day,
-                    current_weather=current_weather
-                )
-                
-                # Wykonaj predykcje
-                temp_pred = self.model.temperature_model.predict(features)[0]
-                precip_pred = self.model.precipitation_model.predict(features)[0]
-                
-                # Dodaj predykcję do listy
-                predictions.append({
-                    'date': next_day.strftime('%Y-%m-%d'),
-                    'predicted_max_temperature': round(temp_pred, 2),
-                    'predicted_precipitation_probability': round(precip_pred, 2),
-                    'location': {
-                        'latitude': latitude,
-                        'longitude': longitude
-                    }
-                })
-            
-            return predictions
-            
-        except Exception as e:
-            logger.error(f"Błąd podczas wykonywania predykcji tygodniowej: {str(e)}")
-            raise
+        return self.predict_next_days(city, latitude, longitude, current_weather, days=7)
+    
+    def predict_next_days(self,
+                          city: str,
+                          latitude: float,
+                          longitude: float,
+                          current_weather: Dict,
+                          days: int) -> List[Dict]:
+        """
+        Wykonuje prognozę dla jednego miasta na podstawie bieżącej pogody.
+        Jeśli `current_weather` nie zawiera daty, przyjmuje dzisiejszą.
+        """
+        row = {'date': datetime.now().strftime('%Y-%m-%d'), **current_weather,
+               'city': city, 'latitude': latitude, 'longitude': longitude}
+        return self.forecast(pd.DataFrame([row]), days)[city]
 
-def get_weather_prediction(city: str, lat: float, lon: float, target_date: datetime) -> dict:
+def observation_freshness(city: str) -> Dict:
+    """
+    Zwraca wiek ostatniej obserwacji miasta w magazynie cech i flagę `stale`,
+    gdy przekracza on MAX_OBSERVATION_AGE_DAYS.
+    """
+    age = get_feature_store().age_days(city)
+    return {
+        "observation_age_days": age,
+        "stale": age is None or age > MAX_OBSERVATION_AGE_DAYS
+    }
+
+def get_weather_prediction(city: str,
+                           lat: float,
+                           lon: float,
+                           target_date: datetime,
+                           quantiles: Optional[List[float]] = None) -> dict:
     """
     Przewiduje pogodę dla danego miasta na określoną datę.
+    Model przewiduje dzień d+1 z cech dnia d, więc predykcja startuje od ostatniej
+    obserwacji z magazynu cech: dla daty dzień po obserwacji to jeden krok modelu,
+    dla dalszych dat - autoregresyjna prognoza do `target_date`.
+    Jeśli podano `quantiles`, zwraca też przedziały predykcji z drzew lasu.
     """
     try:
-        # Sprawdź czy modele istnieją
-        max_temp_model_path = os.path.join("models", "max_temp_model.joblib")
-        min_temp_model_path = os.path.join("models", "min_temp_model.joblib")
-        scaler_path = os.path.join("models", "scaler.joblib")
+        # Pobierz ostatnią obserwację dla miasta z magazynu cech
+        current_weather = get_feature_store().get_many([city]).assign(latitude=lat, longitude=lon)
+        if current_weather.empty:
+            raise ValueError(f"Brak aktualnych danych pogodowych dla miasta {city}")
         
-        if not os.path.exists(max_temp_model_path) or not os.path.exists(min_temp_model_path) or not os.path.exists(scaler_path):
-            raise FileNotFoundError("Modele nie zostały jeszcze wytrenowane. Użyj endpointu /retrain aby wytrenować modele.")
-            
-        # Załaduj modele i scaler
-        max_temp_model = joblib.load(max_temp_model_path)
-        min_temp_model = joblib.load(min_temp_model_path)
-        scaler = joblib.load(scaler_path)
+        observation_date = current_weather['date'].iloc[0]
+        horizon = (pd.Timestamp(target_date.date()) - observation_date).days
+        if horizon < 1 or horizon > MAX_FORECAST_DAYS:
+            raise ForecastHorizonError(
+                f"Data {target_date.strftime('%Y-%m-%d')} wypada {horizon} dni po ostatniej obserwacji "
+                f"({observation_date.strftime('%Y-%m-%d')}); dozwolony zakres to 1-{MAX_FORECAST_DAYS} dni"
+            )
         
-        # Przygotuj dane wejściowe
-        input_features = np.array([
-            lat,                    # latitude
-            lon,                    # longitude
-            target_date.timetuple().tm_yday,  # day_of_year
-            target_date.month,      # month
-            target_date.year,       # year
-            20.0,                   # max_temperature (przykładowa wartość)
-            15.0,                   # min_temperature (przykładowa wartość)
-            15.0,                   # max_windspeed (przykładowa wartość)
-            65.0,                   # humidity (przykładowa wartość)
-            1013.0                  # pressure (przykładowa wartość)
-        ]).reshape(1, -1)
+        with span("artifact_load", city=city):
+            model = load_model(city)
+        predictor = WeatherPredictor(model=model)
+        prediction = predictor.forecast(current_weather, horizon, quantiles)[city][-1]
         
-        # Skaluj dane
-        scaled_features = scaler.transform(input_features)
+        return {
+            "city": city,
+            **prediction,
+            "observation_date": observation_date.strftime("%Y-%m-%d"),
+            "horizon_days": horizon,
+            **observation_freshness(city)
+        }
         
-        # Wykonaj predykcje
-        max_temp_pred = max_temp_model.predict(scaled_features)[0]
-        min_temp_pred = min_temp_model.predict(scaled_features)[0]
+    except Exception as e:
+        logger.error(f"Błąd podczas predykcji: {str(e)}")
+        raise
+
+def get_weather_forecast(city: str,
+                         lat: float,
+                         lon: float,
+                         days: int = 7,
+                         quantiles: Optional[List[float]] = None) -> dict:
+    """
+    Prognozuje pogodę dla danego miasta na kolejne `days` dni,
+    startując od ostatniej obserwacji z magazynu cech.
+    """
+    try:
+        current_weather = get_feature_store().get_many([city]).assign(latitude=lat, longitude=lon)
+        if current_weather.empty:
+            raise ValueError(f"Brak aktualnych danych pogodowych dla miasta {city}")
+        
+        with span("artifact_load", city=city):
+            model = load_model(city)
+        predictor = WeatherPredictor(model=model)
+        forecast = predictor.forecast(current_weather, days, quantiles)[city]
         
         return {
             "city": city,
-            "date": target_date.strftime("%Y-%m-%d"),
-            "predicted_max_temperature": float(max_temp_pred),
-            "predicted_min_temperature": float(min_temp_pred)
+            "last_observation_date": current_weather['date'].iloc[0].strftime("%Y-%m-%d"),
+            **observation_freshness(city),
+            "days": days,
+            "forecast": forecast
         }
         
     except Exception as e:
-        logger.error(f"Błąd podczas predykcji: {str(e)}")
+        logger.error(f"Błąd podczas prognozy: {str(e)}")
         raise
 
 if __name__ == "__main__":
@@ -181,7 +348,6 @@ if __name__ == "__main__":
     current_weather = {
         'max_temperature': 20.0,
         'min_temperature': 15.0,
-        'precipitation_probability': 30.0,
         'max_windspeed': 15.0,
         'humidity': 65.0,
         'pressure': 1013.0
@@ -195,4 +361,14 @@ if __name__ == "__main__":
         target_date=datetime.now()
     )
     
-    print(result) 
\ No newline at end of file
+    print(result)
+    
+    # Prognoza tygodniowa na podstawie bieżącej pogody
+    week = WeatherPredictor().predict_next_week(
+        city="Warsaw",
+        latitude=52.2297,
+        longitude=21.0122,
+        current_weather=current_weather
+    )
+    
+    print(week) 
\ No newline at end of file
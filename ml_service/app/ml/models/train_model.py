@@ -3,12 +3,33 @@ from sklearn.ensemble import RandomForestRegressor
 import joblib
 import logging
 import os
-from app.ml.data_preprocessing.prepare_data import prepare_training_data
+import json
+import pandas as pd
+from joblib import Parallel, delayed
+from app.ml.data_preprocessing.prepare_data import FEATURES, prepare_training_data, load_data, check_quality, prepare_features, build_training_data
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Liczba drzew dokładanych do każdego lasu przy aktualizacji przyrostowej
+INCREMENTAL_TREES = 20
+# Maksymalny udział drzew dokładanych przyrostowo w lesie - powyżej wykonywany jest pełny retrening
+MAX_INCREMENTAL_SHARE = 0.3
+# Liczba historycznych par (cechy, target) z każdego miesiąca kalendarzowego dokładana do nowych
+# danych, żeby nowe drzewa nie widziały tylko pory roku z ostatnich dni
+HISTORY_SAMPLES_PER_MONTH = 200
+# Okno kontrolne: pierwszy rok zbioru testowego ostatniego pełnego treningu (żadne drzewo go nie widziało)
+HOLDOUT_DAYS = 365
+# Dopuszczalny wzrost RMSE względem testu z ostatniego pełnego treningu (nowe dane i okno kontrolne)
+DRIFT_FACTOR = 1.5
+# Dopuszczalny wzrost RMSE na oknie kontrolnym po dołożeniu drzew
+HOLDOUT_TOLERANCE = 1.05
+# Minimalna liczba nowych próbek potrzebna do aktualizacji przyrostowej
+MIN_INCREMENTAL_SAMPLES = 8
+# Katalog modeli per miasto (shardów)
+SHARD_DIR = os.path.join("models", "shards")
+
 class WeatherModel:
     def __init__(self):
         """
@@ -25,6 +46,8 @@ class WeatherModel:
             random_state=42
         )
         self.scaler = None
+        self.quality_report = None
+        self.metadata = None
         
     def train(self, data: dict) -> dict:
         """
@@ -41,46 +64,84 @@ class WeatherModel:
             y_test_max = data['y_test_max']
             y_test_min = data['y_test_min']
             self.scaler = data['scaler']
+            self.quality_report = data.get('quality_report')
             
             # Trenuj modele
             self.max_temp_model.fit(X_train, y_train_max)
             self.min_temp_model.fit(X_train, y_train_min)
             
-            # Dokonaj predykcji na zbiorze testowym
-            y_pred_max = self.max_temp_model.predict(X_test)
-            y_pred_min = self.min_temp_model.predict(X_test)
-            
-            # Oblicz metryki dla max temp
-            mse_max = mean_squared_error(y_test_max, y_pred_max)
-            rmse_max = np.sqrt(mse_max)
-            mae_max = mean_absolute_error(y_test_max, y_pred_max)
-            r2_max = r2_score(y_test_max, y_pred_max)
-            
-            # Oblicz metryki dla min temp
-            mse_min = mean_squared_error(y_test_min, y_pred_min)
-            rmse_min = np.sqrt(mse_min)
-            mae_min = mean_absolute_error(y_test_min, y_pred_min)
-            r2_min = r2_score(y_test_min, y_pred_min)
-            
-            logger.info("\nWyniki trenowania:")
-            logger.info("Temperatura maksymalna:")
-            logger.info(f"RMSE: {rmse_max:.2f}°C")
-            logger.info(f"MAE: {mae_max:.2f}°C")
-            logger.info(f"R2 Score: {r2_max:.3f}")
-            logger.info("\nTemperatura minimalna:")
-            logger.info(f"RMSE: {rmse_min:.2f}°C")
-            logger.info(f"MAE: {mae_min:.2f}°C")
-            logger.info(f"R2 Score: {r2_min:.3f}")
-            
-            return {
-                'max_temp': {'rmse': rmse_max, 'mae': mae_max, 'r2': r2_max},
-                'min_temp': {'rmse': rmse_min, 'mae': mae_min, 'r2': r2_min}
+            # Oceń modele na zbiorze testowym
+            metrics = self.evaluate(X_test, y_test_max, y_test_min)
+            
+            self.metadata = {
+                'mode': 'full',
+                'trained_until': (self.quality_report or {}).get('date_range', {}).get('end'),
+                'test_start': data.get('test_start'),
+                'base_estimators': self.max_temp_model.n_estimators,
+                'n_estimators': self.max_temp_model.n_estimators,
+                'metrics': metrics
             }
             
+            return metrics
+            
         except Exception as e:
             logger.error(f"Błąd podczas trenowania modelu: {str(e)}")
             raise
             
+    def evaluate(self, X: np.ndarray, y_max: np.ndarray, y_min: np.ndarray) -> dict:
+        """
+        Liczy metryki (RMSE, MAE, R2) obu modeli na przeskalowanych danych.
+        """
+        # Dokonaj predykcji
+        y_pred_max = self.max_temp_model.predict(X)
+        y_pred_min = self.min_temp_model.predict(X)
+        
+        # Oblicz metryki dla max temp
+        mse_max = mean_squared_error(y_max, y_pred_max)
+        rmse_max = np.sqrt(mse_max)
+        mae_max = mean_absolute_error(y_max, y_pred_max)
+        r2_max = r2_score(y_max, y_pred_max)
+        
+        # Oblicz metryki dla min temp
+        mse_min = mean_squared_error(y_min, y_pred_min)
+        rmse_min = np.sqrt(mse_min)
+        mae_min = mean_absolute_error(y_min, y_pred_min)
+        r2_min = r2_score(y_min, y_pred_min)
+        
+        logger.info("\nWyniki trenowania:")
+        logger.info("Temperatura maksymalna:")
+        logger.info(f"RMSE: {rmse_max:.2f}°C")
+        logger.info(f"MAE: {mae_max:.2f}°C")
+        logger.info(f"R2 Score: {r2_max:.3f}")
+        logger.info("\nTemperatura minimalna:")
+        logger.info(f"RMSE: {rmse_min:.2f}°C")
+        logger.info(f"MAE: {mae_min:.2f}°C")
+        logger.info(f"R2 Score: {r2_min:.3f}")
+        
+        return {
+            'max_temp': {'rmse': float(rmse_max), 'mae': float(mae_max), 'r2': float(r2_max)},
+            'min_temp': {'rmse': float(rmse_min), 'mae': float(mae_min), 'r2': float(r2_min)}
+        }
+    
+    def train_incremental(self, X_new: np.ndarray, y_new_max: np.ndarray, y_new_min: np.ndarray,
+                          n_new_trees: int = INCREMENTAL_TREES):
+        """
+        Dokłada do obu lasów `n_new_trees` drzew wytrenowanych na podanych danych
+        (warm_start). Nowe drzewa głosują dla każdego wejścia, więc dane powinny
+        obejmować wszystkie pory roku (nowe dni uzupełnione przez sample_history).
+        Istniejące drzewa i skaler pozostają bez zmian, więc `X_new` musi być
+        przeskalowane bieżącym skalerem.
+        """
+        try:
+            logger.info(f"Dokładam {n_new_trees} drzew na {len(X_new)} próbkach...")
+            for forest, y_new in ((self.max_temp_model, y_new_max), (self.min_temp_model, y_new_min)):
+                forest.set_params(warm_start=True, n_estimators=forest.n_estimators + n_new_trees)
+                forest.fit(X_new, y_new)
+                forest.set_params(warm_start=False)
+        except Exception as e:
+            logger.error(f"Błąd podczas trenowania przyrostowego: {str(e)}")
+            raise
+            
     def save(self, model_dir: str):
         """
         Zapisuje wytrenowane modele i skaler do plików.
@@ -96,6 +157,17 @@ class WeatherModel:
             joblib.dump(self.min_temp_model, min_temp_path)
             joblib.dump(self.scaler, scaler_path)
             
+            if self.quality_report is not None:
+                report_path = os.path.join(model_dir, 'data_quality_report.json')
+                with open(report_path, 'w') as f:
+                    json.dump(self.quality_report, f, indent=2)
+                logger.info(f"Raport jakości danych: {report_path}")
+            
+            if self.metadata is not None:
+                metadata_path = os.path.join(model_dir, 'training_metadata.json')
+                with open(metadata_path, 'w') as f:
+                    json.dump(self.metadata, f, indent=2)
+            
             logger.info(f"\nModele zostały zapisane w:")
             logger.info(f"Max temp model: {max_temp_path}")
             logger.info(f"Min temp model: {min_temp_path}")
@@ -118,6 +190,11 @@ class WeatherModel:
             self.min_temp_model = joblib.load(min_temp_path)
             self.scaler = joblib.load(scaler_path)
             
+            metadata_path = os.path.join(model_dir, 'training_metadata.json')
+            if os.path.exists(metadata_path):
+                with open(metadata_path) as f:
+                    self.metadata = json.load(f)
+            
             logger.info(f"\nWczytano modele z:")
             logger.info(f"Max temp model: {max_temp_path}")
             logger.info(f"Min temp model: {min_temp_path}")
@@ -149,6 +226,170 @@ def train_and_save_model() -> dict:
         logger.error(f"Błąd podczas procesu trenowania: {str(e)}")
         raise
 
+def _train_shard(city: str, city_df: pd.DataFrame, shard_dir: str) -> tuple:
+    """
+    Waliduje surowe dane jednego miasta, trenuje i zapisuje jego model
+    (z raportem jakości i metadanymi tylko dla tego miasta).
+    """
+    city_df, quality_report = check_quality(city_df)
+    model = WeatherModel()
+    metrics = model.train(build_training_data(city_df, quality_report))
+    model.save(os.path.join(shard_dir, city))
+    return city, metrics
+
+def train_and_save_sharded_models(n_jobs: int = -1, shard_dir: str = SHARD_DIR) -> dict:
+    """
+    Trenuje osobny model dla każdego miasta (shard) - równolegle, po jednym
+    procesie na miasto. Każdy shard przechodzi własną walidację jakości danych.
+    Zwraca metryki per miasto.
+    """
+    try:
+        data_path = "data/historical_weather.csv"
+        logger.info(f"Wczytuję dane z pliku: {data_path}")
+        df = pd.read_csv(data_path)
+        
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_train_shard)(city, city_df.copy(), shard_dir)
+            for city, city_df in df.groupby('city', sort=False)
+        )
+        
+        logger.info(f"Wytrenowano {len(results)} shardów w {shard_dir}")
+        return dict(results)
+        
+    except Exception as e:
+        logger.error(f"Błąd podczas trenowania shardów: {str(e)}")
+        raise
+
+def sample_history(X: np.ndarray, y_max: np.ndarray, y_min: np.ndarray,
+                   per_month: int = HISTORY_SAMPLES_PER_MONTH,
+                   seed: int = 42) -> tuple:
+    """
+    Losuje do `per_month` par (cechy, target) z każdego miesiąca kalendarzowego,
+    żeby drzewa dokładane przyrostowo widziały wszystkie pory roku.
+    """
+    rng = np.random.default_rng(seed)
+    months = X[:, FEATURES.index('month')]
+    idx = np.concatenate([
+        rng.choice(np.flatnonzero(months == month), min(per_month, int((months == month).sum())), replace=False)
+        for month in np.unique(months)
+    ])
+    return X[idx], y_max[idx], y_min[idx]
+
+def drift_reason(model: WeatherModel, window_metrics: dict,
+                 n_new_trees: int = INCREMENTAL_TREES,
+                 max_incremental_share: float = MAX_INCREMENTAL_SHARE,
+                 drift_factor: float = DRIFT_FACTOR) -> str:
+    """
+    Zwraca powód, dla którego aktualizacja przyrostowa nie wystarczy
+    (pusty napis, jeśli można dołożyć drzewa). `window_metrics` to metryki
+    bieżącego modelu na oknach danych (nowe dni, okno kontrolne) porównywane
+    z testem ostatniego pełnego treningu.
+    """
+    n_estimators = model.max_temp_model.n_estimators + n_new_trees
+    share = (n_estimators - model.metadata['base_estimators']) / n_estimators
+    if share > max_incremental_share:
+        return f"drzewa przyrostowe stanowiłyby {share:.0%} lasu (limit {max_incremental_share:.0%})"
+    
+    baseline = model.metadata['metrics']
+    for window, metrics in window_metrics.items():
+        for target in ('max_temp', 'min_temp'):
+            if metrics[target]['rmse'] > drift_factor * baseline[target]['rmse']:
+                return (f"dryf dla {target} ({window}): RMSE {metrics[target]['rmse']:.2f}°C "
+                        f"> {drift_factor} x {baseline[target]['rmse']:.2f}°C")
+    return ""
+
+def update_and_save_model(n_new_trees: int = INCREMENTAL_TREES,
+                          max_incremental_share: float = MAX_INCREMENTAL_SHARE,
+                          drift_factor: float = DRIFT_FACTOR,
+                          holdout_tolerance: float = HOLDOUT_TOLERANCE) -> dict:
+    """
+    Aktualizuje zapisany model danymi dopisanymi od ostatniego treningu,
+    dokładając nowe drzewa (warm_start) wytrenowane na nowych danych
+    i próbce historii ze wszystkich miesięcy. Wykonuje pełny retrening, gdy brak
+    zapisanego modelu, wykryto dryf, drzewa przyrostowe przekroczyłyby
+    `max_incremental_share` lasu albo aktualizacja pogorszyłaby wynik
+    na rocznym oknie kontrolnym.
+    """
+    try:
+        model = WeatherModel()
+        if os.path.exists(os.path.join("models", "training_metadata.json")):
+            model.load("models")
+        required = ('trained_until', 'test_start', 'base_estimators')
+        if not model.metadata or not all(model.metadata.get(key) for key in required):
+            logger.info("Brak metadanych poprzedniego treningu - wykonuję pełny retrening")
+            return {'mode': 'full', 'metrics': train_and_save_model()}
+        
+        data_path = "data/historical_weather.csv"
+        df, quality_report = load_data(data_path)
+        
+        # Ostatni dzień poprzedniego treningu daje pierwszą parę (cechy, target) z nowym targetem;
+        # prepare_features łączy w pary tylko kolejne dni tego samego miasta
+        trained_until = pd.Timestamp(model.metadata['trained_until'])
+        X_new, y_new_max, y_new_min = prepare_features(df[df['date'] >= trained_until].copy())
+        
+        if len(X_new) < MIN_INCREMENTAL_SAMPLES:
+            logger.info(f"Za mało nowych danych ({len(X_new)} próbek) - model bez zmian")
+            return {'mode': 'skipped', 'new_samples': len(X_new)}
+        
+        # Historia sprzed zbioru testowego (na niej uczyły się drzewa bazowe) i roczne okno
+        # kontrolne z początku zbioru testowego, którego nie widziało żadne drzewo
+        test_start = pd.Timestamp(model.metadata['test_start'])
+        X_hist, y_hist_max, y_hist_min = sample_history(*prepare_features(df[df['date'] < test_start].copy()))
+        holdout = df[(df['date'] >= test_start) & (df['date'] < test_start + pd.Timedelta(days=HOLDOUT_DAYS))]
+        X_year, y_year_max, y_year_min = prepare_features(holdout.copy())
+        
+        X_new = model.scaler.transform(X_new)
+        X_hist = model.scaler.transform(X_hist)
+        X_year = model.scaler.transform(X_year)
+        window_metrics = {
+            'recent': model.evaluate(X_new, y_new_max, y_new_min),
+            'year': model.evaluate(X_year, y_year_max, y_year_min)
+        }
+        
+        reason = drift_reason(model, window_metrics, n_new_trees, max_incremental_share, drift_factor)
+        if reason:
+            logger.info(f"Pełny retrening: {reason}")
+            return {'mode': 'full', 'reason': reason, 'metrics': train_and_save_model()}
+        
+        model.train_incremental(
+            np.vstack([X_new, X_hist]),
+            np.concatenate([y_new_max, y_hist_max]),
+            np.concatenate([y_new_min, y_hist_min]),
+            n_new_trees
+        )
+        
+        # Nowe drzewa głosują dla wszystkich pór roku - sprawdź, czy nie pogorszyły okna kontrolnego
+        year_after = model.evaluate(X_year, y_year_max, y_year_min)
+        for target in ('max_temp', 'min_temp'):
+            before = window_metrics['year'][target]['rmse']
+            if year_after[target]['rmse'] > holdout_tolerance * before:
+                reason = (f"aktualizacja pogorszyła {target} na oknie kontrolnym: "
+                          f"RMSE {year_after[target]['rmse']:.2f}°C > {holdout_tolerance} x {before:.2f}°C")
+                logger.info(f"Pełny retrening: {reason}")
+                return {'mode': 'full', 'reason': reason, 'metrics': train_and_save_model()}
+        
+        model.quality_report = quality_report
+        model.metadata = {
+            **model.metadata,
+            'mode': 'incremental',
+            'trained_until': quality_report['date_range']['end'],
+            'n_estimators': model.max_temp_model.n_estimators
+        }
+        model.save("models")
+        
+        return {
+            'mode': 'incremental',
+            'new_samples': len(X_new),
+            'history_samples': len(X_hist),
+            'n_estimators': model.max_temp_model.n_estimators,
+            'metrics_before_update': window_metrics,
+            'holdout_metrics_after_update': year_after
+        }
+        
+    except Exception as e:
+        logger.error(f"Błąd podczas aktualizacji przyrostowej: {str(e)}")
+        raise
+
 if __name__ == "__main__":
     metrics = train_and_save_model()
     logger.info("Model został pomyślnie wytrenowany i zapisany") 
\ No newline at end of file
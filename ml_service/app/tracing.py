@@ -0,0 +1,91 @@
+"""
+Lekkie śledzenie żądań. O próbkowaniu decyduje backend (nagłówek X-Trace-Sampled),
+a identyfikator śladu przychodzi w nagłówku X-Trace-Id. Spany są dopisywane
+jako linie JSON do TRACE_FILE (lokalny zamiennik kolektora).
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+SERVICE_NAME = "ml_service"
+TRACE_HEADER = "X-Trace-Id"
+PARENT_SPAN_HEADER = "X-Parent-Span-Id"
+SAMPLED_HEADER = "X-Trace-Sampled"
+
+# Dopuszczalny format identyfikatorów z nagłówków (hex, ograniczona długość)
+_VALID_ID = re.compile(r"[0-9a-f]{16,32}")
+
+# Odsetek śledzonych żądań bez nagłówka X-Trace-Sampled (0 wyłącza próbkowanie)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# (trace_id, id bieżącego spanu) obsługiwanego żądania; None, gdy nie jest śledzone
+_context: ContextVar[Optional[Tuple[str, Optional[str]]]] = ContextVar("trace_context", default=None)
+_export_lock = threading.Lock()
+
+def _export(record: Dict) -> None:
+    line = json.dumps(record)
+    with _export_lock:
+        with open(TRACE_FILE, "a") as f:
+            f.write(line + "\n")
+
+def start_trace(trace_id: Optional[str] = None,
+                parent_id: Optional[str] = None,
+                sampled: Optional[str] = None) -> Optional[str]:
+    """
+    Rozpoczyna śledzenie bieżącego żądania zgodnie z decyzją nadawcy (`sampled`
+    "1"/"0"); bez niej próbkuje lokalnie z TRACE_SAMPLE_RATE. Nieprawidłowe
+    identyfikatory z nagłówków są odrzucane. Zwraca identyfikator śladu lub None.
+    """
+    if sampled == "0":
+        return None
+    if trace_id is not None and not _VALID_ID.fullmatch(trace_id):
+        trace_id = None
+    if parent_id is not None and not _VALID_ID.fullmatch(parent_id):
+        parent_id = None
+    if sampled != "1":
+        if TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE:
+            return None
+    if trace_id is None:
+        trace_id = uuid.uuid4().hex
+    _context.set((trace_id, parent_id))
+    return trace_id
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Zapisuje span obejmujący blok. Nic nie robi, gdy żądanie nie jest śledzone.
+    """
+    context = _context.get()
+    if context is None:
+        yield
+        return
+
+    trace_id, parent_id = context
+    span_id = uuid.uuid4().hex[:16]
+    token = _context.set((trace_id, span_id))
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        _context.reset(token)
+        _export({
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "service": SERVICE_NAME,
+            "name": name,
+            "start": start,
+            "duration_ms": round(duration_ms, 3),
+            "attributes": attributes
+        })
+